@@ -0,0 +1,86 @@
+# _clients.py
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+BIGQUERY_PROJECT_ID = os.environ.get("BIGQUERY_PROJECT_ID", "your-project-id")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "your-llm-model-name")
+VERTEX_LOCATION = os.environ.get("VERTEX_LOCATION", "us-central1")
+
+# Keep-alive connections shared by every request on this instance
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 64))
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- # 
+
+# --- LAZY CLIENT GETTERS ---
+# Each client (and its SDK import) is built on first use and then shared by the whole process,
+# so importing this module costs nothing on a cold start. See audio_processing.warm_up().
+
+@lru_cache(maxsize=None)
+def get_credentials():
+    import google.auth
+    credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+    return credentials
+
+def _pooled_session(credentials):
+    """
+    AuthorizedSession with a larger connection pool, so concurrent uploads
+    reuse warm TLS connections instead of opening new ones.
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    session = AuthorizedSession(credentials)
+    # pool_block=False: past the limit, open an extra connection rather than wait for one
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    return session
+
+@lru_cache(maxsize=None)
+def get_storage_client():
+    from google.cloud import storage
+    credentials = get_credentials()
+    return storage.Client(
+        project=BIGQUERY_PROJECT_ID,
+        credentials=credentials,
+        _http=_pooled_session(credentials),
+    )
+
+@lru_cache(maxsize=None)
+def get_bucket(bucket_name: str):
+    return get_storage_client().bucket(bucket_name)
+
+@lru_cache(maxsize=None)
+def get_bq_client():
+    from google.cloud import bigquery
+    credentials = get_credentials()
+    return bigquery.Client(
+        project=BIGQUERY_PROJECT_ID,
+        credentials=credentials,
+        _http=_pooled_session(credentials),
+    )
+
+@lru_cache(maxsize=None)
+def get_bq_write_client():
+    # gRPC: one HTTP/2 channel multiplexes every append
+    from google.cloud import bigquery_storage_v1
+    return bigquery_storage_v1.BigQueryWriteClient(credentials=get_credentials())
+
+@lru_cache(maxsize=None)
+def init_vertexai():
+    from vertexai import init
+    init(project=BIGQUERY_PROJECT_ID, location=VERTEX_LOCATION, credentials=get_credentials())
+
+@lru_cache(maxsize=None)
+def get_gemini_model():
+    from vertexai.generative_models import GenerativeModel
+    init_vertexai()
+    return GenerativeModel(GEMINI_MODEL)
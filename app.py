@@ -1,24 +1,55 @@
 # app.py
 import os
-import tempfile
 import uuid
-from flask import Flask, render_template, request, jsonify
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, url_for
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from google.cloud import bigquery
 import audio_processing as ap
 
 load_dotenv()
 
 # --- CONFIG ---
 GCS_BUCKET = os.environ.get("GCS_BUCKET", "your-gcs-bucket-name")
-BIGQUERY_PROJECT = ap.BIGQUERY_PROJECT_ID
 ALLOWED_EXTENSIONS = {"wav", "flac", "mp3", "m4a", "ogg"}
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 4))
+MAX_TRACKED_JOBS = 1000
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 200 * 1024 * 1024  # 200MB max
 
-bq_client = bigquery.Client(project=BIGQUERY_PROJECT)
+# --- BACKGROUND JOBS ---
+# Gemini analysis + BigQuery writes run here so /upload does not hold a worker for the whole pipeline.
+# Job state lives in this process, so run a single worker process and scale with threads.
+_pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _set_job(job_id, state):
+    with _jobs_lock:
+        _jobs[job_id] = state
+        # Evict the oldest finished jobs only: a job still processing (or whose
+        # result was just stored) must stay pollable, so the cap can be exceeded by running jobs
+        excess = len(_jobs) - MAX_TRACKED_JOBS
+        if excess > 0:
+            finished = [
+                old_id for old_id, job in _jobs.items()
+                if job["status"] != "processing" and old_id != job_id
+            ]
+            for old_id in finished[:excess]:
+                del _jobs[old_id]
+
+
+def _run_pipeline_job(job_id, staged):
+    try:
+        result = ap.analyze_and_store(**staged)
+        _set_job(job_id, {"status": "ok", "data": result})
+    except Exception as e:
+        print(f"❌ Pipeline job {job_id} failed: {e}")
+        _set_job(job_id, {"status": "error", "message": str(e)})
 
 
 def allowed_file(filename):
@@ -43,40 +74,48 @@ def upload():
     if not allowed_file(file.filename):
         return jsonify({"status": "error", "message": "File type not allowed"}), 400
 
-    # --- Save file temporarily ---
+    # --- Werkzeug has already spooled the upload; stream it on without a disk copy ---
     filename = secure_filename(file.filename)
-    tmpdir = tempfile.mkdtemp()
-    local_path = os.path.join(tmpdir, filename)
-    file.save(local_path)
 
     # --- Destination path in GCS ---
     dest_name = f"upload_audio/{uuid.uuid4().hex}_{filename}"
 
     try:
-        # 🔥 Core pipeline call (NO agent name passed)
-        result = ap.process_local_file_and_upload(
-            local_path=local_path,
+        # --- Stage audio in GCS (needs the request stream, so it runs inline) ---
+        staged = ap.stage_audio_file(
+            audio_file=file.stream,
+            filename=filename,
             bucket_name=GCS_BUCKET,
             dest_blob_name=dest_name
         )
 
-        return jsonify({
-            "status": "ok",
-            "data": result
-        })
-
     except Exception as e:
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
 
-    finally:
-        # --- Cleanup local temp file ---
-        try:
-            os.remove(local_path)
-        except Exception:
-            pass
+    # 🔥 Core pipeline call (NO agent name passed), off the request path
+    job_id = uuid.uuid4().hex
+    _set_job(job_id, {"status": "processing"})
+    _pipeline_executor.submit(_run_pipeline_job, job_id, staged)
+
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "status_url": url_for("job_status", job_id=job_id)
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job id"}), 404
+
+    return jsonify(job)
 
 
 if __name__ == "__main__":
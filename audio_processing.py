@@ -1,19 +1,27 @@
 # audio_processing.py
 import os
 import re
-import random
 import json
-import mimetypes
 import time
+import atexit
+import threading
+import subprocess
+import uuid
+import tempfile
+import hashlib
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, BinaryIO, Optional
 from dotenv import load_dotenv
-from google.cloud import bigquery, storage
-from vertexai import init
-from vertexai.generative_models import GenerativeModel, Part
-from pydantic import BaseModel, Field
-from pydub import AudioSegment
-from datetime import datetime
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from pydantic import BaseModel, Field, ValidationError, field_validator
+import mutagen
+from datetime import datetime, timedelta, timezone
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from _clients import get_bucket, get_bq_client, get_bq_write_client, get_gemini_model, init_vertexai
 
 load_dotenv()
 
@@ -22,53 +30,162 @@ BIGQUERY_PROJECT_ID = os.environ.get("BIGQUERY_PROJECT_ID", "your-project-id")
 BIGQUERY_DATASET = os.environ.get("BIGQUERY_DATASET", "your-dataset-name")
 BIGQUERY_TABLE_CUSTOMERS = os.environ.get("BIGQUERY_TABLE_CUSTOMERS", "your-customer-table-name")
 BIGQUERY_TABLE_EMPLOYEES = os.environ.get("BIGQUERY_TABLE_EMPLOYEES", "your-employee-table-name")
+BIGQUERY_TABLE_ANALYSIS_CACHE = os.environ.get("BIGQUERY_TABLE_ANALYSIS_CACHE", "your-analysis-cache-table-name")
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "your-llm-model-name")
 GCS_BUCKET = os.environ.get("GCS_BUCKET", "your-gcs-bucket-name")
 
-# --- CLIENT INITIALIZATION ---
-try:
-    bigquery_client = bigquery.Client(project=BIGQUERY_PROJECT_ID)
-    storage_client = storage.Client()
-    init(project=BIGQUERY_PROJECT_ID, location="us-central1")
-    gemini_model = GenerativeModel(GEMINI_MODEL)
-    print("✅ Clients initialized successfully.")
-except Exception as e:
-    print(f"❌ Error initializing clients: {e}")
-    raise SystemExit(1)
+CUSTOMER_TABLE_ID = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE_CUSTOMERS}"
+EMPLOYEE_TABLE_ID = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE_EMPLOYEES}"
+ANALYSIS_CACHE_TABLE_ID = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE_ANALYSIS_CACHE}"
+
+# Rows buffered before a flush is forced; partial batches are flushed on a timer
+BQ_INSERT_BATCH_SIZE = int(os.environ.get("BQ_INSERT_BATCH_SIZE", 500))
+BQ_FLUSH_INTERVAL_SECONDS = float(os.environ.get("BQ_FLUSH_INTERVAL_SECONDS", 5))
+# Failed appends: retried with exponential backoff (starting at the flush interval) up to this many attempts
+BQ_APPEND_MAX_ATTEMPTS = int(os.environ.get("BQ_APPEND_MAX_ATTEMPTS", 5))
+BQ_APPEND_TIMEOUT_SECONDS = float(os.environ.get("BQ_APPEND_TIMEOUT_SECONDS", 60))
+# Buffered rows are also journaled here until BigQuery accepts them, so a crash does not lose them
+BQ_JOURNAL_DIR = os.environ.get("BQ_JOURNAL_DIR", os.path.join(tempfile.gettempdir(), "call_analytics_bq_journal"))
+
+# Resumable GCS upload chunk size (must be a multiple of 256KB); CRC32C is computed per chunk
+GCS_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Vertex AI context cache holding the fixed analysis prompt
+PROMPT_CACHE_TTL = timedelta(hours=1)
+# Smallest prompt Vertex AI will cache; below it the cache path is switched off for good
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", 4096))
+
+# Covers every extension app.py accepts; avoids mimetypes' lazy /etc/mime.types parsing
+AUDIO_MIME_TYPES = {
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+}
+
+_JSON_FENCE_RE = re.compile(r"```json(.*?)```", re.DOTALL)
+_NON_DIGIT_RE = re.compile(r"\D")
 
 # ---------------------------------------------------------------------------------------------------------------------------------------- # 
 
 # --- STRUCTURE FOR OUTPUT ---
 class CallAnalysis(BaseModel):
-    phone_number: str = Field(description="10-digit number, or 'Incomplete phone number' / 'Missing phone number'")
-    problem_solved: str = Field(description="Solved or Pending")
-    problem_type: str = Field(description="Payment, Network, Recharge")
-    sentiment: str = Field(description="Summary of customer’s emotional tone")
-    full_transcript: str = Field(description="Full corrected transcript text")
-    agent_name: str = Field(description="Full name of Agent or the employee talking to the customer")
-    agent_tone: str = Field(description="Tone of the Agent in a summarized form")
-    empathy_score: int = Field(description="Overall empathy of the Agent")
-    clarity_score: int = Field(description="How clear the Agent/Employee was during the call in solving the complaint")
-    interruption_behavior: str = Field(description="How well the Agent listened to the complaint without unwanted interruptions")
-    improvement_suggestions: str = Field(description="Suggestions on the field or areas of improvement for the Agent")
-    overall_agent_feedback: str = Field(description="Overall feedback of the Agent considering the above points")
+    # Every field has a default: a field Gemini leaves out is stored empty rather than failing the call
+    phone_number: str = Field(default="", description="10-digit number, or 'Incomplete phone number' / 'Missing phone number'")
+    problem_solved: str = Field(default="", description="Solved or Pending")
+    problem_type: str = Field(default="", description="Payment, Network, Recharge")
+    sentiment: str = Field(default="", description="Summary of customer’s emotional tone")
+    full_transcript: str = Field(default="", description="Full corrected transcript text")
+    agent_name: str = Field(default="", description="Full name of Agent or the employee talking to the customer")
+    agent_tone: str = Field(default="", description="Tone of the Agent in a summarized form")
+    empathy_score: int = Field(default=0, description="Overall empathy of the Agent")
+    clarity_score: int = Field(default=0, description="How clear the Agent/Employee was during the call in solving the complaint")
+    interruption_behavior: str = Field(default="", description="How well the Agent listened to the complaint without unwanted interruptions")
+    improvement_suggestions: str = Field(default="", description="Suggestions on the field or areas of improvement for the Agent")
+    overall_agent_feedback: str = Field(default="", description="Overall feedback of the Agent considering the above points")
+
+    @field_validator(
+        "phone_number", "problem_solved", "problem_type", "sentiment", "full_transcript",
+        "agent_name", "agent_tone", "interruption_behavior", "overall_agent_feedback",
+        mode="before"
+    )
+    @classmethod
+    def _null_as_empty(cls, value):
+        # Gemini sometimes answers null instead of "" for fields it cannot determine
+        return "" if value is None else value
+
+    @field_validator("improvement_suggestions", mode="before")
+    @classmethod
+    def _join_suggestions(cls, value):
+        # Gemini sometimes returns the bullet points as a list
+        return normalize_improvement_suggestions(value)
+
+    @field_validator("empathy_score", "clarity_score", mode="before")
+    @classmethod
+    def _blank_score_as_zero(cls, value):
+        # The prompt allows "" for fields that cannot be determined; scores sometimes come back as 4.5
+        if value in ("", None):
+            return 0
+        if isinstance(value, float):
+            return round(value)
+        return value
 
 # ---------------------------------------------------------------------------------------------------------------------------------------- # 
 
 # --- HELPERS ---
 
-def generate_customer_id() -> int:
-    return random.randint(10000, 99999)
+def generate_customer_id() -> str:
+    """
+    Collision-safe customer ID (random UUID, hex), used as the join key
+    between the customer and employee tables.
+    """
+    return uuid.uuid4().hex
 
-def get_call_duration_seconds(local_path: str) -> int:
+def _file_behind_stream(audio_file: BinaryIO):
     """
-    Returns call duration in seconds.
+    Returns (path, pass_fds) that let ffprobe open the file backing a stream,
+    or None for in-memory streams.
+    Covers local files (by name) and Werkzeug's upload spool once it has rolled over
+    to an anonymous temp file (via /dev/fd). A spool still held in memory is left alone:
+    fileno() on a SpooledTemporaryFile would force it onto disk.
     """
-    audio = AudioSegment.from_file(local_path)
-    return int(len(audio) / 1000)
+    if not getattr(audio_file, "_rolled", True):
+        return None
+    name = getattr(audio_file, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, ()
+    try:
+        fd = audio_file.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    if os.path.exists(f"/dev/fd/{fd}"):
+        return f"/dev/fd/{fd}", (fd,)
+    return None
+
+def get_call_duration_seconds(audio_file: BinaryIO) -> Optional[int]:
+    """
+    Returns call duration in seconds, read from the audio header (no decoding).
+    Falls back to ffprobe when the header does not carry a usable length: on the file
+    behind the stream when there is one (seekable, so trailing m4a moov atoms work),
+    otherwise on the in-memory bytes through a pipe.
+    Returns None if the duration cannot be determined; the column is NULLABLE.
+    """
+    try:
+        audio = mutagen.File(audio_file)
+        if audio is not None and audio.info.length:
+            return int(audio.info.length)
+    except mutagen.MutagenError as e:
+        print(f"⚠️ Could not read audio header: {e}")
+
+    source = _file_behind_stream(audio_file)
+    if source is not None:
+        probe_input, pass_fds, stdin_bytes = source[0], source[1], None
+    else:
+        audio_file.seek(0)
+        probe_input, pass_fds, stdin_bytes = "pipe:0", (), audio_file.read()
+
+    try:
+        probe = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                probe_input,
+            ],
+            input=stdin_bytes,
+            pass_fds=pass_fds,
+            capture_output=True,
+            check=True,
+            timeout=60,
+        )
+        return int(float(probe.stdout.decode().strip()))
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        print(f"⚠️ Could not determine call duration, storing NULL: {e}")
+        return None
 
 def clean_phone_number(phone: str) -> str:
-    digits = re.sub(r"\D", "", phone or "")
+    digits = _NON_DIGIT_RE.sub("", phone or "")
     if len(digits) == 10:
         return digits
     elif 7 <= len(digits) < 10:
@@ -93,40 +210,74 @@ def extract_agent_from_filename(filename: str):
     Expected format: agentName-employeeId.ext
     Example: RohitSharma-EMP1023.wav
     """
-    name = Path(filename).stem
+    name = os.path.splitext(filename)[0]
     if "-" in name:
         agent_name, employee_id = name.split("-", 1)
         return agent_name.strip(), employee_id.strip()
     return "Unknown", "UNKNOWN_EMP"
 
 
-def upload_file_to_gcs(local_path: str, bucket_name: str, dest_blob_name: str):
-    mime_type, _ = mimetypes.guess_type(local_path)
-    if mime_type is None:
-        mime_type = "application/octet-stream"
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(dest_blob_name)
-    print(f"⬆️ Uploading {local_path} → gs://{bucket_name}/{dest_blob_name}")
-    blob.upload_from_filename(local_path)
-    return f"gs://{bucket_name}/{dest_blob_name}", mime_type
+class _HashingReader:
+    """
+    Wraps a seekable binary stream and computes its SHA-256 while it is being read,
+    so the upload to GCS doubles as the content-hash pass.
+    Bytes re-read after a seek back (e.g. a retried upload chunk) are only hashed once.
+    """
 
-# ---------------------------------------------------------------------------------------------------------------------------------------- # 
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self._hasher = hashlib.sha256()
+        self._hashed = 0
+        self._size = raw.seek(0, os.SEEK_END)
+        raw.seek(0)
 
-# --- MAIN PROCESSING FUNCTION ---
+    def read(self, size: int = -1) -> bytes:
+        start = self._raw.tell()
+        data = self._raw.read(size)
+        end = start + len(data)
+        if start <= self._hashed < end:
+            self._hasher.update(data[self._hashed - start:])
+            self._hashed = end
+        return data
 
-def transcribe_and_analyze_audio(gcs_uri: str, agent_name: str, mime_type: str = None) -> Dict[str, Any]:
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._raw.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._raw.tell()
+
+    def hexdigest(self):
+        """Returns the SHA-256 hex digest, or None if the stream was not read to the end."""
+        if self._hashed != self._size:
+            return None
+        return self._hasher.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def upload_file_to_gcs(audio_file: BinaryIO, filename: str, bucket_name: str, dest_blob_name: str, mime_type: str):
     """
-    Single Gemini prompt that does BOTH:
-    - Transcription
-    - Analysis (phone number, problem solved, type, sentiment)
+    Streams an open audio file straight to GCS (rewinding it first),
+    so uploads never need an extra copy on local disk.
+    Integrity is checked with CRC32C (C extension via google-crc32c) instead of MD5.
     """
-    mime_type = mime_type or mimetypes.guess_type(gcs_uri)[0] or "audio/wav"
+    blob = get_bucket(bucket_name).blob(dest_blob_name, chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+    print(f"⬆️ Uploading {filename} → gs://{bucket_name}/{dest_blob_name}")
+    blob.upload_from_file(
+        audio_file,
+        content_type=mime_type,
+        rewind=True,
+        checksum="crc32c",
+        if_generation_match=0  # never overwrite an existing recording
+    )
+    return f"gs://{bucket_name}/{dest_blob_name}", mime_type
 
-    print(f"🎧 Starting combined transcription + analysis for {gcs_uri} ({mime_type})")
+# ---------------------------------------------------------------------------------------------------------------------------------------- # 
 
-    audio_part = Part.from_uri(gcs_uri, mime_type=mime_type)
+# --- PROMPT ---
 
-    unified_prompt = """
+UNIFIED_PROMPT = """
             You are an expert Airtel call quality analyst.
 
             Carefully listen to the entire audio recording and produce a structured JSON response.
@@ -179,22 +330,127 @@ def transcribe_and_analyze_audio(gcs_uri: str, agent_name: str, mime_type: str =
             }
 """
 
+# --- GEMINI CONTEXT CACHE ---
+
+_cached_model = None
+_cached_model_expires_at = None
+_cached_model_lock = threading.Lock()
+_prompt_cache_disabled = False
+_prompt_size_checked = False
+
+def get_cached_model(force_refresh: bool = False):
+    """
+    Returns a model bound to a Vertex AI context cache holding UNIFIED_PROMPT,
+    (re)creating the cache when it is missing or about to expire.
+    Returns None if the cache cannot be created, so callers send the full prompt instead.
+    The prompt is measured with count_tokens once; if it is below PROMPT_CACHE_MIN_TOKENS
+    the cache path is disabled for the life of the process.
+    """
+    global _cached_model, _cached_model_expires_at, _prompt_cache_disabled, _prompt_size_checked
+    if _prompt_cache_disabled:
+        return None
+
+    now = datetime.now(timezone.utc)
+    if not force_refresh and _cached_model_expires_at is not None and now < _cached_model_expires_at:
+        return _cached_model
+
+    # Another thread is already (re)creating the cache: send the full prompt rather than wait on its RPC
+    if not _cached_model_lock.acquire(blocking=False):
+        return None
+
     try:
-        response = gemini_model.generate_content([audio_part, unified_prompt])
+        try:
+            from vertexai.preview import caching
+            from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+
+            if not _prompt_size_checked:
+                prompt_tokens = get_gemini_model().count_tokens(UNIFIED_PROMPT).total_tokens
+                _prompt_size_checked = True
+                if prompt_tokens < PROMPT_CACHE_MIN_TOKENS:
+                    print(
+                        f"ℹ️ Prompt is {prompt_tokens} tokens, below the {PROMPT_CACHE_MIN_TOKENS}-token "
+                        "context cache minimum; sending full prompt."
+                    )
+                    _prompt_cache_disabled = True
+                    return None
+
+            init_vertexai()
+            cached_content = caching.CachedContent.create(
+                model_name=GEMINI_MODEL,
+                contents=[UNIFIED_PROMPT],
+                ttl=PROMPT_CACHE_TTL,
+            )
+            _cached_model = PreviewGenerativeModel.from_cached_content(cached_content=cached_content)
+            print("✅ Prompt context cache created.")
+        except Exception as e:
+            print(f"⚠️ Prompt context cache unavailable, sending full prompt: {e}")
+            _cached_model = None
+
+        # Refresh a little before the server-side expiry (also throttles retries after a failure)
+        _cached_model_expires_at = now + PROMPT_CACHE_TTL - timedelta(minutes=1)
+        return _cached_model
+    finally:
+        _cached_model_lock.release()
+
+def generate_analysis(audio_part):
+    """
+    Sends only the audio to the cached-prompt model, falling back to
+    audio + full prompt on the plain model when no cache is available.
+    """
+    from google.api_core.exceptions import NotFound
+
+    cached_model = get_cached_model()
+    if cached_model is not None:
+        try:
+            return cached_model.generate_content([audio_part])
+        except NotFound:
+            # Cache was evicted or expired server-side: rebuild it and retry once
+            cached_model = get_cached_model(force_refresh=True)
+            if cached_model is not None:
+                return cached_model.generate_content([audio_part])
+
+    return get_gemini_model().generate_content([audio_part, UNIFIED_PROMPT])
+
+# --- MAIN PROCESSING FUNCTION ---
+
+def transcribe_and_analyze_audio(gcs_uri: str, agent_name: str, mime_type: str = None) -> Dict[str, Any]:
+    """
+    Single Gemini prompt that does BOTH:
+    - Transcription
+    - Analysis (phone number, problem solved, type, sentiment)
+    """
+    from vertexai.generative_models import Part
+
+    mime_type = mime_type or AUDIO_MIME_TYPES.get(Path(gcs_uri).suffix.lower(), "audio/wav")
+
+    print(f"🎧 Starting combined transcription + analysis for {gcs_uri} ({mime_type})")
+
+    audio_part = Part.from_uri(gcs_uri, mime_type=mime_type)
+
+    try:
+        response = generate_analysis(audio_part)
         raw = response.text.strip()
 
-        match = re.search(r"```json(.*?)```", raw, re.DOTALL)
-        if match:
-            raw = match.group(1).strip()
+        if "```json" in raw:
+            match = _JSON_FENCE_RE.search(raw)
+            if match:
+                raw = match.group(1).strip()
 
+        # Parse + validate in one pass (pydantic-core); schema drift is rejected here, before BigQuery
         try:
-            parsed = json.loads(raw)
-        except json.JSONDecodeError:
-            print(f"⚠️ Failed to parse JSON from Gemini output. Raw content:\n{raw}")
-            return {"error": "Invalid JSON", "raw_output": raw}
+            parsed = CallAnalysis.model_validate_json(raw).model_dump()
+        except ValidationError as e:
+            if any(error["type"] == "json_invalid" for error in e.errors()):
+                print(f"⚠️ Gemini returned malformed JSON: {e}\nRaw content:\n{raw}")
+                return {"error": "Invalid JSON", "raw_output": raw}
+            print(f"⚠️ Gemini output does not match CallAnalysis: {e}\nRaw content:\n{raw}")
+            problems = "; ".join(
+                f"{'.'.join(map(str, error['loc'])) or 'output'}: {error['msg']}" for error in e.errors()
+            )
+            return {"error": f"Output does not match the expected schema ({problems})", "raw_output": raw}
 
         # Validate and clean phone number
-        parsed["phone_number"] = clean_phone_number(parsed.get("phone_number", ""))
+        parsed["phone_number"] = clean_phone_number(parsed["phone_number"])
         return parsed
 
     except Exception as e:
@@ -213,10 +469,432 @@ def resolve_agent_identity(parsed_data: dict, filename: str):
 
     return final_agent_name, employee_id
 
-def insert_customer_data(data: dict, customer_id: int, gcs_uri: str):
-    table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE_CUSTOMERS}"
+# --- BIGQUERY STORAGE WRITE (PROTOBUF ROWS) ---
 
-    row = [{
+# AppendRowsRequest limits: 10MB per request, kept just under; 10k rows per request
+_APPEND_MAX_BYTES = 9 * 1024 * 1024
+_APPEND_MAX_ROWS = 10000
+
+_PROTO_FIELD_TYPES = {
+    "STRING": descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+    "INTEGER": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    "TIMESTAMP": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,  # microseconds since epoch
+}
+
+def _build_row_writer(message_name: str, schema: list) -> dict:
+    """
+    Builds a proto2 message class matching a BigQuery schema from table_creator.py,
+    so rows can be sent over the Storage Write API without a protoc build step.
+    """
+    file_proto = descriptor_pb2.FileDescriptorProto(name=f"{message_name}.proto", syntax="proto2")
+    message_proto = file_proto.message_type.add(name=message_name)
+    for number, field in enumerate(schema, start=1):
+        message_proto.field.add(
+            name=field.name,
+            number=number,
+            type=_PROTO_FIELD_TYPES[field.field_type],
+            label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL,
+        )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    descriptor = pool.FindMessageTypeByName(message_name)
+
+    return {
+        "message_class": message_factory.GetMessageClass(descriptor),
+        "proto_descriptor": message_proto,
+        "field_types": {field.name: field.field_type for field in schema},
+    }
+
+@lru_cache(maxsize=None)
+def _row_writers() -> dict:
+    from table_creator import CUSTOMER_SCHEMA, EMPLOYEE_SCHEMA, ANALYSIS_CACHE_SCHEMA
+    return {
+        CUSTOMER_TABLE_ID: _build_row_writer("CustomerCallRow", CUSTOMER_SCHEMA),
+        EMPLOYEE_TABLE_ID: _build_row_writer("EmployeePerformanceRow", EMPLOYEE_SCHEMA),
+        ANALYSIS_CACHE_TABLE_ID: _build_row_writer("AnalysisCacheRow", ANALYSIS_CACHE_SCHEMA),
+    }
+
+def _serialize_row(writer: dict, row: dict) -> bytes:
+    message = writer["message_class"]()
+    for name, value in row.items():
+        if value is None:
+            continue
+        field_type = writer["field_types"][name]
+        if field_type == "TIMESTAMP":
+            value = int(datetime.fromisoformat(value).timestamp() * 1_000_000)
+        elif field_type == "INTEGER":
+            value = int(value)
+        else:
+            value = str(value)
+        setattr(message, name, value)
+    return message.SerializeToString()
+
+# gRPC codes worth retrying: DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, INTERNAL, UNAVAILABLE.
+# Anything else (NOT_FOUND, PERMISSION_DENIED, INVALID_ARGUMENT after a schema change, ...) will not fix itself.
+_RETRYABLE_APPEND_CODES = {4, 8, 13, 14}
+
+def _is_retryable_append_error(error: Exception) -> bool:
+    from google.api_core import exceptions as api_exceptions
+    return isinstance(error, (
+        api_exceptions.DeadlineExceeded,
+        api_exceptions.TooManyRequests,  # includes ResourceExhausted
+        api_exceptions.InternalServerError,
+        api_exceptions.ServiceUnavailable,
+        ConnectionError,
+        TimeoutError,
+    ))
+
+def _append_rows(table_id: str, rows: list):
+    """
+    Appends rows to the table's _default stream, split into
+    AppendRowsRequests that stay under the row and size limits.
+    Returns (retryable, permanent): indexes of rows that were not written,
+    split by whether a retry can succeed. Rows in neither list were written.
+    """
+    from google.cloud.bigquery_storage_v1 import types as bq_storage_types
+
+    bq_write_client = get_bq_write_client()
+    writer = _row_writers()[table_id]
+    project, dataset, table = table_id.split(".")
+    stream_name = f"{bq_write_client.table_path(project, dataset, table)}/streams/_default"
+
+    request_batches = []
+    batch, batch_bytes = [], 0
+    for row in rows:
+        serialized = _serialize_row(writer, row)
+        if batch and (len(batch) >= _APPEND_MAX_ROWS or batch_bytes + len(serialized) > _APPEND_MAX_BYTES):
+            request_batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(serialized)
+        batch_bytes += len(serialized)
+    if batch:
+        request_batches.append(batch)
+
+    append_requests = (
+        bq_storage_types.AppendRowsRequest(
+            write_stream=stream_name,
+            proto_rows=bq_storage_types.AppendRowsRequest.ProtoData(
+                writer_schema=bq_storage_types.ProtoSchema(proto_descriptor=writer["proto_descriptor"]),
+                rows=bq_storage_types.ProtoRows(serialized_rows=serialized_rows),
+            ),
+        )
+        for serialized_rows in request_batches
+    )
+
+    # Same routing header the library's AppendRowsStream sends; the API needs it to find the table's region
+    metadata = (("x-goog-request-params", f"write_stream={stream_name}"),)
+
+    retryable, permanent = [], []
+    start = 0
+    try:
+        responses = iter(bq_write_client.append_rows(
+            append_requests, metadata=metadata, timeout=BQ_APPEND_TIMEOUT_SECONDS
+        ))
+        for serialized_rows in request_batches:
+            response = next(responses)
+            indexes = range(start, start + len(serialized_rows))
+            if response.row_errors:
+                # A request with an invalid row writes none of its rows:
+                # the invalid rows are permanent failures, the others are retried
+                rejected = {start + row_error.index for row_error in response.row_errors}
+                for row_error in response.row_errors:
+                    print(f"❌ Row rejected by {table_id}: {row_error.message}")
+                permanent.extend(i for i in indexes if i in rejected)
+                retryable.extend(i for i in indexes if i not in rejected)
+            elif "error" in response:
+                print(f"❌ Append to {table_id} failed: {response.error.message}")
+                if response.error.code in _RETRYABLE_APPEND_CODES:
+                    retryable.extend(indexes)
+                else:
+                    permanent.extend(indexes)
+            start += len(serialized_rows)
+    except Exception as e:
+        # Stream broke: every request without a response failed the same way
+        print(f"❌ Append stream to {table_id} failed: {e}")
+        unanswered = range(start, len(rows))
+        (retryable if _is_retryable_append_error(e) else permanent).extend(unanswered)
+
+    return retryable, permanent
+
+# --- TABLE SCHEMA CHECK ---
+
+_table_schemas_ok = False
+
+def check_table_schemas():
+    """
+    Raises if a BigQuery table is missing or its column types differ from table_creator.py
+    (e.g. an INTEGER customer_id from before `python table_creator.py migrate`),
+    so uploads fail loudly instead of every append being rejected.
+    Re-checked until it passes, so running the migration takes effect without a restart.
+    """
+    global _table_schemas_ok
+    if _table_schemas_ok:
+        return
+
+    from google.api_core.exceptions import NotFound
+    from table_creator import CUSTOMER_SCHEMA, EMPLOYEE_SCHEMA, ANALYSIS_CACHE_SCHEMA
+
+    problems = []
+    for table_id, schema in (
+        (CUSTOMER_TABLE_ID, CUSTOMER_SCHEMA),
+        (EMPLOYEE_TABLE_ID, EMPLOYEE_SCHEMA),
+        (ANALYSIS_CACHE_TABLE_ID, ANALYSIS_CACHE_SCHEMA),
+    ):
+        try:
+            live_types = {field.name: field.field_type for field in get_bq_client().get_table(table_id).schema}
+        except NotFound:
+            problems.append(f"{table_id} does not exist")
+            continue
+        for field in schema:
+            live_type = live_types.get(field.name)
+            if live_type != field.field_type:
+                problems.append(f"{table_id}.{field.name} is {live_type or 'missing'}, expected {field.field_type}")
+
+    if problems:
+        raise RuntimeError(
+            "BigQuery tables do not match table_creator.py; run `python table_creator.py migrate`: "
+            + "; ".join(problems)
+        )
+    _table_schemas_ok = True
+
+# --- BIGQUERY INSERT BUFFER ---
+
+# Entries are (row, journal_path) pairs
+_customer_buffer = []
+_employee_buffer = []
+_analysis_cache_buffer = []
+_buffers = {
+    CUSTOMER_TABLE_ID: _customer_buffer,
+    EMPLOYEE_TABLE_ID: _employee_buffer,
+    ANALYSIS_CACHE_TABLE_ID: _analysis_cache_buffer,
+}
+# Rows whose append failed with a retryable error: (row, journal_path, attempts) entries,
+# kept apart so they do not count toward BQ_INSERT_BATCH_SIZE, and not retried before _retry_at[table_id]
+_retry_buffers = {table_id: [] for table_id in _buffers}
+_retry_at = {}
+_buffer_lock = threading.Lock()
+_flush_timer = None
+_flush_due = None
+
+_journal_lock_file = None
+
+@lru_cache(maxsize=None)
+def _own_journal_dir() -> str:
+    """
+    This process's subdirectory of BQ_JOURNAL_DIR. An exclusive lock on
+    <subdirectory>.lock is held for the life of the process, which is how
+    replay_journal() tells a live process's journal from one left behind.
+    """
+    global _journal_lock_file
+    os.makedirs(BQ_JOURNAL_DIR, exist_ok=True)
+    journal_dir = os.path.join(BQ_JOURNAL_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    # Lock first, then create the directory: a directory without a held lock is always orphaned
+    _journal_lock_file = open(f"{journal_dir}.lock", "w")
+    if fcntl is not None:
+        fcntl.flock(_journal_lock_file, fcntl.LOCK_EX)
+    os.makedirs(journal_dir, exist_ok=True)
+    return journal_dir
+
+def _journal_row(table_id: str, row: dict) -> str:
+    """
+    Persists a row to this process's journal before it is buffered; removed once BigQuery accepts it.
+    """
+    journal_path = os.path.join(_own_journal_dir(), f"{uuid.uuid4().hex}.json")
+    tmp_path = f"{journal_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"table_id": table_id, "row": row}, f)
+    os.replace(tmp_path, journal_path)
+    return journal_path
+
+def _discard_journal(journal_path: str):
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
+def _claim_journal_files(journal_dir: Path) -> list:
+    """
+    Moves journal files into this process's journal. A file another process
+    claimed first fails to rename and is skipped, so every row is re-queued once.
+    """
+    claimed = []
+    for journal_path in journal_dir.glob("*.json"):
+        claimed_path = os.path.join(_own_journal_dir(), journal_path.name)
+        try:
+            os.rename(journal_path, claimed_path)
+        except OSError:
+            continue
+        claimed.append(claimed_path)
+    return claimed
+
+def _claim_orphaned_journals() -> list:
+    """
+    Claims the journals of processes that are gone, i.e. whose lock is no longer held.
+    """
+    own_dir = _own_journal_dir()
+    claimed = []
+
+    for lock_path in Path(BQ_JOURNAL_DIR).glob("*.lock"):
+        journal_dir = lock_path.with_suffix("")
+        if journal_dir.name == os.path.basename(own_dir) or not journal_dir.is_dir():
+            continue
+        try:
+            lock_fd = os.open(lock_path, os.O_RDWR)
+        except OSError:
+            continue  # removed by another process's replay
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_fd)
+            continue  # owner still running
+        try:
+            if journal_dir.is_dir():
+                claimed.extend(_claim_journal_files(journal_dir))
+                for leftover in journal_dir.iterdir():  # half-written *.tmp files
+                    leftover.unlink(missing_ok=True)
+                journal_dir.rmdir()
+            lock_path.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"⚠️ Could not clean up journal {journal_dir}: {e}")
+        finally:
+            os.close(lock_fd)
+
+    return claimed
+
+def replay_journal():
+    """
+    Re-queues rows that processes which have since exited journaled but never wrote to BigQuery.
+    Each orphaned journal file is claimed by exactly one process, so
+    concurrent workers (or Werkzeug's reloader parent and child) never replay the same row twice.
+    """
+    if fcntl is None:
+        print("⚠️ No fcntl on this platform; journaled rows from earlier runs are not replayed.")
+        return
+
+    replayed = 0
+    for journal_path in _claim_orphaned_journals():
+        try:
+            with open(journal_path, encoding="utf-8") as f:
+                record = json.load(f)
+            buffer = _buffers[record["table_id"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Skipping unreadable journal entry {journal_path}: {e}")
+            continue
+        with _buffer_lock:
+            buffer.append((record["row"], journal_path))
+        replayed += 1
+
+    if replayed:
+        print(f"🔁 Re-queued {replayed} journaled rows for BigQuery.")
+        _schedule_flush()
+
+def _schedule_flush(delay: float = BQ_FLUSH_INTERVAL_SECONDS):
+    """
+    Starts the background timer that flushes partial batches and due retries.
+    A running timer is kept unless this flush is due sooner.
+    """
+    global _flush_timer, _flush_due
+    due = time.monotonic() + delay
+    with _buffer_lock:
+        if _flush_timer is not None:
+            if _flush_due <= due:
+                return
+            _flush_timer.cancel()
+        _flush_timer = threading.Timer(delay, flush_insert_buffers)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+        _flush_due = due
+
+def _enqueue_rows(entries: list):
+    """
+    Journals (table_id, row) pairs, then appends them under a single lock
+    acquisition, so a concurrent flush sees either all of them or none.
+    """
+    journaled = [(table_id, row, _journal_row(table_id, row)) for table_id, row in entries]
+
+    with _buffer_lock:
+        for table_id, row, journal_path in journaled:
+            _buffers[table_id].append((row, journal_path))
+        batch_full = any(len(_buffers[table_id]) >= BQ_INSERT_BATCH_SIZE for table_id, _ in entries)
+
+    if batch_full:
+        flush_insert_buffers()
+    else:
+        _schedule_flush()
+
+def flush_insert_buffers(final: bool = False):
+    """
+    Drains the row buffers (and retries that are due) into BigQuery through the Storage Write API.
+    Journal entries are removed only for rows that were written.
+    Rows that failed with a retryable error are retried with exponential backoff,
+    up to BQ_APPEND_MAX_ATTEMPTS. Permanent failures and rows out of attempts are dropped
+    from memory but stay in the journal, so replay_journal() picks them up on the next start.
+    """
+    global _flush_timer
+    now = time.monotonic()
+    with _buffer_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        pending = []
+        for table_id, buffer in _buffers.items():
+            entries = [(row, journal_path, 0) for row, journal_path in buffer]
+            buffer.clear()
+            retry_buffer = _retry_buffers[table_id]
+            if retry_buffer and now >= _retry_at.get(table_id, 0):
+                entries = retry_buffer[:] + entries
+                retry_buffer.clear()
+            pending.append((table_id, entries))
+
+    for table_id, entries in pending:
+        if not entries:
+            continue
+        try:
+            retryable, permanent = _append_rows(table_id, [row for row, _, _ in entries])
+        except Exception as e:
+            print(f"❌ Error writing {len(entries)} rows to {table_id}: {e}")
+            all_rows = list(range(len(entries)))
+            retryable, permanent = (all_rows, []) if _is_retryable_append_error(e) else ([], all_rows)
+
+        not_written = set(retryable) | set(permanent)
+        for index, (_, journal_path, _) in enumerate(entries):
+            if index not in not_written:
+                _discard_journal(journal_path)
+
+        if permanent:
+            print(f"❌ {len(permanent)} rows for {table_id} cannot be written as is; left in the journal.")
+
+        retry = []
+        for index in sorted(retryable):
+            row, journal_path, attempts = entries[index]
+            if attempts + 1 < BQ_APPEND_MAX_ATTEMPTS:
+                retry.append((row, journal_path, attempts + 1))
+        if len(retry) < len(retryable):
+            print(
+                f"❌ {len(retryable) - len(retry)} rows for {table_id} failed "
+                f"{BQ_APPEND_MAX_ATTEMPTS} attempts; left in the journal."
+            )
+
+        if retry:
+            delay = BQ_FLUSH_INTERVAL_SECONDS * 2 ** (max(attempts for _, _, attempts in retry) - 1)
+            print(f"🔁 Retrying {len(retry)} rows for {table_id} in {delay:g}s.")
+            with _buffer_lock:
+                _retry_buffers[table_id][:0] = retry
+                _retry_at[table_id] = max(_retry_at.get(table_id, 0), time.monotonic() + delay)
+
+    if final:
+        return
+    with _buffer_lock:
+        retry_due = [_retry_at[table_id] for table_id, buffer in _retry_buffers.items() if buffer]
+    if retry_due:
+        _schedule_flush(max(0.0, min(retry_due) - time.monotonic()))
+
+atexit.register(flush_insert_buffers, final=True)
+replay_journal()
+
+def build_customer_row(data: dict, customer_id: str, gcs_uri: str, created_at: str) -> dict:
+    return {
         "customer_id": customer_id,
         "phone_number": data.get("phone_number"),
         "problem_solved": data.get("problem_solved"),
@@ -224,16 +902,12 @@ def insert_customer_data(data: dict, customer_id: int, gcs_uri: str):
         "sentiment": data.get("sentiment"),
         "full_transcript": data.get("full_transcript"),
         "call_gcs_uri": gcs_uri,
-        "created_at": datetime.now().isoformat()
-    }]
-
-    bigquery_client.load_table_from_json(row, table_id).result()
-
+        "created_at": created_at
+    }
 
-def insert_employee_data(data: dict, customer_id: int, agent_name: str, employee_id: str,call_duration_seconds: int):
-    table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE_EMPLOYEES}"
 
-    row = [{
+def build_employee_row(data: dict, customer_id: str, agent_name: str, employee_id: str,call_duration_seconds: Optional[int], created_at: str) -> dict:
+    return {
         "employee_id": employee_id,
         "agent_name": agent_name,
         "customer_id": customer_id,
@@ -244,10 +918,68 @@ def insert_employee_data(data: dict, customer_id: int, agent_name: str, employee
         "improvement_suggestions": normalize_improvement_suggestions(data.get("improvement_suggestions")),
         "overall_agent_feedback": data.get("overall_agent_feedback"),
         "call_duration_seconds": call_duration_seconds,
-        "created_at": datetime.now().isoformat()
-    }]
+        "created_at": created_at
+    }
+
+
+def insert_call_records(customer_row: dict, employee_row: dict):
+    """
+    Queues the customer and employee rows of one call together, so they go out in the same flush.
+    This is not atomic: each table gets its own append, and if only one succeeds
+    the other row is retried from the buffer / journal (see flush_insert_buffers).
+    """
+    _enqueue_rows([
+        (CUSTOMER_TABLE_ID, customer_row),
+        (EMPLOYEE_TABLE_ID, employee_row),
+    ])
+
+# --- ANALYSIS CACHE (by audio content hash) ---
+
+def get_cached_analysis(audio_sha256: str):
+    """
+    Returns a previous Gemini result for byte-identical audio, or None on a miss.
+    Old entries drop out through the cache table's partition expiration.
+    The created_at bound prunes to the live partitions and the table is clustered
+    on audio_sha256, so a lookup reads only the blocks holding that hash.
+    """
+    from google.cloud import bigquery
+    from table_creator import ANALYSIS_CACHE_TTL_DAYS
+
+    query = (
+        f"SELECT result FROM `{ANALYSIS_CACHE_TABLE_ID}` "
+        "WHERE audio_sha256 = @audio_sha256 AND created_at >= @not_before "
+        "ORDER BY created_at DESC LIMIT 1"
+    )
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("audio_sha256", "STRING", audio_sha256),
+            bigquery.ScalarQueryParameter(
+                "not_before", "TIMESTAMP",
+                datetime.now(timezone.utc) - timedelta(days=ANALYSIS_CACHE_TTL_DAYS)
+            ),
+        ]
+    )
+
+    try:
+        # jobs.query returns the rows in its response, no job insert + polling round trips
+        rows = list(get_bq_client().query_and_wait(query, job_config=job_config, max_results=1))
+    except Exception as e:
+        print(f"⚠️ Analysis cache lookup failed, running Gemini: {e}")
+        return None
+
+    if not rows:
+        return None
 
-    bigquery_client.load_table_from_json(row, table_id).result()
+    print(f"♻️ Reusing cached analysis for audio {audio_sha256[:12]}…")
+    return json.loads(rows[0]["result"])
+
+
+def cache_analysis(audio_sha256: str, result: dict, created_at: str):
+    _enqueue_rows([(ANALYSIS_CACHE_TABLE_ID, {
+        "audio_sha256": audio_sha256,
+        "result": json.dumps(result),
+        "created_at": created_at
+    })])
 
 '''
 def insert_to_bigquery(data: dict, customer_id: int):
@@ -280,60 +1012,106 @@ def insert_to_bigquery(data: dict, customer_id: int):
 '''
 
 # --- MAIN EXECUTION ---
-def process_local_file_and_upload(
-    local_path: str,
+def stage_audio_file(
+    audio_file: BinaryIO,
+    filename: str,
     bucket_name: str = GCS_BUCKET,
     dest_blob_name: str = None
 ):
     """
-    Uploads a local audio file to GCS and runs the complete call analysis pipeline.
+    First half of the pipeline, the only part that needs the audio bytes:
+    1) Read call duration from the audio header
+    2) Upload audio to GCS, hashing it (SHA-256) on the way
 
-    Pipeline:
-    1) Upload audio to GCS
-    2) Gemini transcription + analysis
-    3) Resolve agent identity (Gemini → filename fallback)
-    4) Insert customer data into customer_call_analysis
-    5) Insert employee data into employee_performance
-
-    Returns structured analysis data and gs:// URI.
+    Returns the keyword arguments for analyze_and_store(), so the rest of the
+    pipeline can run later (e.g. on a background worker) from the gs:// URI alone.
     """
 
+    # --- Parse the filename once ---
+    file_path = Path(filename)
+    mime_type = AUDIO_MIME_TYPES.get(file_path.suffix.lower(), "application/octet-stream")
+
     # --- Prepare destination name in GCS ---
     if dest_blob_name is None:
         dest_blob_name = (
-            f"upload_audio/{Path(local_path).stem}_"
-            f"{random.randint(1000,9999)}{Path(local_path).suffix}"
+            f"upload_audio/{file_path.stem}_"
+            f"{uuid.uuid4().hex[:8]}{file_path.suffix}"
         )
 
-    # --- Upload to GCS ---
-    gs_uri, mime_type = upload_file_to_gcs(local_path, bucket_name, dest_blob_name)
+    # --- Get audio length (header read only; the upload rewinds the stream) ---
+    call_duration_seconds = get_call_duration_seconds(audio_file)
+
+    # --- Upload to GCS (content hash computed from the same reads) ---
+    hashing_file = _HashingReader(audio_file)
+    gs_uri, mime_type = upload_file_to_gcs(hashing_file, filename, bucket_name, dest_blob_name, mime_type)
+
+    return {
+        "gs_uri": gs_uri,
+        "mime_type": mime_type,
+        "filename": filename,
+        "call_duration_seconds": call_duration_seconds,
+        "audio_sha256": hashing_file.hexdigest()
+    }
+
+
+def analyze_and_store(
+    gs_uri: str,
+    mime_type: str,
+    filename: str,
+    call_duration_seconds: Optional[int],
+    audio_sha256: str = None
+):
+    """
+    Second half of the pipeline, for audio already staged in GCS:
+    3) Gemini transcription + analysis
+       (skipped when the same audio was analyzed before, see get_cached_analysis)
+    4) Resolve agent identity (Gemini → filename fallback)
+    5) Queue customer data for customer_call_analysis
+       and employee data for employee_performance, in the same flush
+       (streamed to BigQuery in batches, see flush_insert_buffers; not atomic across the two tables)
+
+    Returns structured analysis data and gs:// URI.
+    """
+
+    # --- Refuse to analyze a call whose rows BigQuery would reject ---
+    check_table_schemas()
+
+    # --- One UTC timestamp shared by every row of this call ---
+    created_at = datetime.now(timezone.utc).isoformat()
 
-    # --- Run Gemini analysis (NO agent name passed) ---
-    result = transcribe_and_analyze_audio(gcs_uri=gs_uri, agent_name="", mime_type=mime_type)
+    # --- Reuse a previous analysis of identical audio ---
+    result = get_cached_analysis(audio_sha256) if audio_sha256 else None
+
+    if result is None:
+        # --- Run Gemini analysis (NO agent name passed) ---
+        result = transcribe_and_analyze_audio(gcs_uri=gs_uri, agent_name="", mime_type=mime_type)
+        if "error" in result:
+            raise RuntimeError(f"Gemini analysis failed: {result['error']}")
+        if audio_sha256:
+            cache_analysis(audio_sha256, result, created_at)
 
     # --- Generate customer ID ---
     customer_id = generate_customer_id()
 
-    # --- Get audio length ---
-    call_duration_seconds = get_call_duration_seconds(local_path)
-
     # --- Resolve agent identity ---
-    filename = Path(local_path).name
     final_agent_name, employee_id = resolve_agent_identity(result,filename)
 
-    # --- Insert into BigQuery (separate tables) ---
-    insert_customer_data(
-        data=result,
-        customer_id=customer_id,
-        gcs_uri=gs_uri
-    )
-
-    insert_employee_data(
-        data=result,
-        customer_id=customer_id,
-        agent_name=final_agent_name,
-        employee_id=employee_id,
-        call_duration_seconds=call_duration_seconds
+    # --- Insert into BigQuery (separate tables, queued for the same flush) ---
+    insert_call_records(
+        customer_row=build_customer_row(
+            data=result,
+            customer_id=customer_id,
+            gcs_uri=gs_uri,
+            created_at=created_at
+        ),
+        employee_row=build_employee_row(
+            data=result,
+            customer_id=customer_id,
+            agent_name=final_agent_name,
+            employee_id=employee_id,
+            call_duration_seconds=call_duration_seconds,
+            created_at=created_at
+        )
     )
 
     # --- Return combined response ---
@@ -346,6 +1124,64 @@ def process_local_file_and_upload(
     }
 
 
+def process_audio_file_and_upload(
+    audio_file: BinaryIO,
+    filename: str,
+    bucket_name: str = GCS_BUCKET,
+    dest_blob_name: str = None
+):
+    """
+    Uploads an open audio file to GCS and runs the complete call analysis pipeline
+    synchronously. `audio_file` can be any seekable binary stream.
+    """
+    staged = stage_audio_file(audio_file, filename, bucket_name, dest_blob_name)
+    return analyze_and_store(**staged)
+
+
+def process_local_file_and_upload(
+    local_path: str,
+    bucket_name: str = GCS_BUCKET,
+    dest_blob_name: str = None
+):
+    """
+    Runs the complete call analysis pipeline for an audio file on local disk,
+    with a sequential readahead hint for the upload.
+    The default buffer is kept: the upload's chunk-sized reads bypass it anyway,
+    and a large buffer would turn every small header read after a seek into a full refill.
+    """
+    with open(local_path, "rb") as audio_file:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(audio_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        return process_audio_file_and_upload(
+            audio_file=audio_file,
+            filename=Path(local_path).name,
+            bucket_name=bucket_name,
+            dest_blob_name=dest_blob_name
+        )
+
+
+# --- WARM-UP ---
+
+def warm_up():
+    """
+    Builds the clients, row writers and prompt cache ahead of the first request.
+    Runs on a background thread started at import, so it overlaps with app startup
+    and the first GCS upload instead of blocking either.
+    """
+    try:
+        get_bucket(GCS_BUCKET)
+        get_bq_write_client()
+        get_gemini_model()
+        _row_writers()
+        get_cached_model()
+        check_table_schemas()
+        print("✅ Clients initialized successfully.")
+    except Exception as e:
+        print(f"❌ Error initializing clients: {e}")
+
+threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
 if __name__ == "__main__":
     local_file = "sample_audio.wav"
     if os.path.exists(local_file):
@@ -1,6 +1,8 @@
 # clean_up.py
 import os
+import sys
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,12 +14,16 @@ BQ_DATASET_ID = os.getenv("BIGQUERY_DATASET")
 # --- TABLE NAMES ---
 CUSTOMER_TABLE_ID = f"{GCP_PROJECT_ID}.{BQ_DATASET_ID}.tbl_customer_call_analysis"
 EMPLOYEE_TABLE_ID = f"{GCP_PROJECT_ID}.{BQ_DATASET_ID}.tbl_employee_performance"
+ANALYSIS_CACHE_TABLE_ID = f"{GCP_PROJECT_ID}.{BQ_DATASET_ID}.tbl_analysis_cache"
+
+# Cached Gemini results expire with their daily partition
+ANALYSIS_CACHE_TTL_DAYS = int(os.getenv("ANALYSIS_CACHE_TTL_DAYS", 30))
 
 # -------------------------------------------------
 # CUSTOMER CALL ANALYSIS TABLE SCHEMA
 # -------------------------------------------------
 CUSTOMER_SCHEMA = [
-    bigquery.SchemaField("customer_id", "INTEGER", mode="REQUIRED"),
+    bigquery.SchemaField("customer_id", "STRING", mode="REQUIRED"),
     bigquery.SchemaField("phone_number", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("problem_solved", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("problem_type", "STRING", mode="NULLABLE"),
@@ -27,13 +33,20 @@ CUSTOMER_SCHEMA = [
     bigquery.SchemaField("created_at", "TIMESTAMP", mode="NULLABLE"),
 ]
 
+# Daily partitions on created_at + clustering: date / issue-type filtered queries scan far fewer bytes
+CUSTOMER_PARTITIONING = bigquery.TimePartitioning(
+    type_=bigquery.TimePartitioningType.DAY,
+    field="created_at",
+)
+CUSTOMER_CLUSTERING = ["problem_type"]
+
 # -------------------------------------------------
 # EMPLOYEE PERFORMANCE TABLE SCHEMA
 # -------------------------------------------------
 EMPLOYEE_SCHEMA = [
     bigquery.SchemaField("employee_id", "STRING", mode="REQUIRED"),
     bigquery.SchemaField("agent_name", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("customer_id", "INTEGER", mode="REQUIRED"),
+    bigquery.SchemaField("customer_id", "STRING", mode="REQUIRED"),
     bigquery.SchemaField("agent_tone", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("empathy_score", "INTEGER", mode="NULLABLE"),
     bigquery.SchemaField("clarity_score", "INTEGER", mode="NULLABLE"),
@@ -44,10 +57,39 @@ EMPLOYEE_SCHEMA = [
     bigquery.SchemaField("created_at", "TIMESTAMP", mode="NULLABLE"),
 ]
 
+EMPLOYEE_PARTITIONING = bigquery.TimePartitioning(
+    type_=bigquery.TimePartitioningType.DAY,
+    field="created_at",
+)
+EMPLOYEE_CLUSTERING = ["employee_id", "agent_name"]
+
+# -------------------------------------------------
+# ANALYSIS CACHE TABLE SCHEMA (Gemini results by audio hash)
+# -------------------------------------------------
+ANALYSIS_CACHE_SCHEMA = [
+    bigquery.SchemaField("audio_sha256", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("result", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("created_at", "TIMESTAMP", mode="REQUIRED"),
+]
+
+ANALYSIS_CACHE_PARTITIONING = bigquery.TimePartitioning(
+    type_=bigquery.TimePartitioningType.DAY,
+    field="created_at",
+    expiration_ms=ANALYSIS_CACHE_TTL_DAYS * 24 * 60 * 60 * 1000,
+)
+# Lookups are by hash: clustering keeps a lookup from reading every cached transcript
+ANALYSIS_CACHE_CLUSTERING = ["audio_sha256"]
+
 # -------------------------------------------------
 # HELPER: RESET TABLE
 # -------------------------------------------------
-def reset_table(client: bigquery.Client, table_id: str, schema: list):
+def reset_table(
+    client: bigquery.Client,
+    table_id: str,
+    schema: list,
+    time_partitioning=None,
+    clustering_fields=None
+):
     print(f"\n🔄 Resetting table: {table_id}")
 
     try:
@@ -58,11 +100,92 @@ def reset_table(client: bigquery.Client, table_id: str, schema: list):
 
     try:
         table = bigquery.Table(table_id, schema=schema)
+        table.time_partitioning = time_partitioning
+        table.clustering_fields = clustering_fields
         client.create_table(table)
         print("✅ Table created successfully.")
     except Exception as e:
         print(f"❌ Error creating table: {e}")
 
+# -------------------------------------------------
+# HELPER: MIGRATE EXISTING TABLE (keeps rows)
+# -------------------------------------------------
+def migrate_table(
+    client: bigquery.Client,
+    table_id: str,
+    schema: list,
+    time_partitioning=None,
+    clustering_fields=None
+):
+    """
+    One-off migration for tables created before customer_id became a STRING
+    and before partitioning/clustering were added.
+    Copies the rows aside with customer_id cast to STRING, recreates the table
+    with the current schema and layout and copies the rows back.
+    The backup table is only dropped once the copy back succeeded.
+    """
+    print(f"\n🔁 Migrating table: {table_id}")
+
+    table = client.get_table(table_id)
+    field_types = {field.name: field.field_type for field in table.schema}
+    if (
+        field_types.get("customer_id") == "STRING"
+        and table.time_partitioning is not None
+        and table.clustering_fields == clustering_fields
+    ):
+        print("✅ Already migrated.")
+        return
+
+    backup_id = f"{table_id}_migration_backup"
+    columns = ", ".join(field.name for field in schema)
+
+    client.query(
+        f"CREATE OR REPLACE TABLE `{backup_id}` AS "
+        f"SELECT * REPLACE (CAST(customer_id AS STRING) AS customer_id) FROM `{table_id}`"
+    ).result()
+
+    reset_table(client, table_id, schema, time_partitioning, clustering_fields)
+
+    client.query(
+        f"INSERT INTO `{table_id}` ({columns}) SELECT {columns} FROM `{backup_id}`"
+    ).result()
+
+    client.delete_table(backup_id, not_found_ok=True)
+    print("✅ Migration complete.")
+
+# -------------------------------------------------
+# HELPER: CREATE OR UPDATE TABLE (keeps rows)
+# -------------------------------------------------
+def ensure_table(
+    client: bigquery.Client,
+    table_id: str,
+    schema: list,
+    time_partitioning=None,
+    clustering_fields=None
+):
+    """
+    Creates the table if it is missing, otherwise brings its clustering up to date.
+    For tables that need no data migration.
+    """
+    print(f"\n🔎 Ensuring table: {table_id}")
+
+    try:
+        table = client.get_table(table_id)
+    except NotFound:
+        table = bigquery.Table(table_id, schema=schema)
+        table.time_partitioning = time_partitioning
+        table.clustering_fields = clustering_fields
+        client.create_table(table)
+        print("✅ Table created successfully.")
+        return
+
+    if table.clustering_fields != clustering_fields:
+        table.clustering_fields = clustering_fields
+        client.update_table(table, ["clustering_fields"])
+        print("✅ Clustering updated.")
+    else:
+        print("✅ Already up to date.")
+
 # -------------------------------------------------
 # MAIN
 # -------------------------------------------------
@@ -72,8 +195,17 @@ def main():
 
     client = bigquery.Client(project=GCP_PROJECT_ID)
 
-    reset_table(client, CUSTOMER_TABLE_ID, CUSTOMER_SCHEMA)
-    reset_table(client, EMPLOYEE_TABLE_ID, EMPLOYEE_SCHEMA)
+    # `python table_creator.py migrate` keeps existing rows; the default resets every table
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        migrate_table(client, CUSTOMER_TABLE_ID, CUSTOMER_SCHEMA, CUSTOMER_PARTITIONING, CUSTOMER_CLUSTERING)
+        migrate_table(client, EMPLOYEE_TABLE_ID, EMPLOYEE_SCHEMA, EMPLOYEE_PARTITIONING, EMPLOYEE_CLUSTERING)
+        ensure_table(client, ANALYSIS_CACHE_TABLE_ID, ANALYSIS_CACHE_SCHEMA, ANALYSIS_CACHE_PARTITIONING, ANALYSIS_CACHE_CLUSTERING)
+        print("\n🎉 BigQuery tables migrated successfully.")
+        return
+
+    reset_table(client, CUSTOMER_TABLE_ID, CUSTOMER_SCHEMA, CUSTOMER_PARTITIONING, CUSTOMER_CLUSTERING)
+    reset_table(client, EMPLOYEE_TABLE_ID, EMPLOYEE_SCHEMA, EMPLOYEE_PARTITIONING, EMPLOYEE_CLUSTERING)
+    reset_table(client, ANALYSIS_CACHE_TABLE_ID, ANALYSIS_CACHE_SCHEMA, ANALYSIS_CACHE_PARTITIONING, ANALYSIS_CACHE_CLUSTERING)
 
     print("\n🎉 BigQuery tables reset successfully.")
 